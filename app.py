@@ -16,7 +16,7 @@ References and sources:
 # Flask
 from flask import Flask
 from flask import redirect, render_template, request
-from flask import session
+from flask import g, session
 
 # Set up config before import extensions
 app = Flask('silkroad')
@@ -27,11 +27,33 @@ try:
 except ImportError as e:
     print(e)
 
+# Cache compiled templates on disk so each worker only pays template
+# parse/compile cost the first time it ever sees a template
+import os
+import tempfile
+from jinja2 import FileSystemBytecodeCache
+_jinja_cache_dir = os.path.join(tempfile.gettempdir(), 'silkroad-jinja-cache')
+os.makedirs(_jinja_cache_dir, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(_jinja_cache_dir)
+
 # Database
 from flask_sqlalchemy import SQLAlchemy
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
 db = SQLAlchemy(app)
 
+# Have psycopg2 hand NUMERIC columns (pay, price, ...) back as pre-formatted
+# strings rather than Decimal objects. They are only ever displayed, so
+# converting once in the driver's typecaster beats materializing a Decimal
+# per cell and formatting it later in Python
+import decimal
+_FORMATTED_NUMERIC = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, 'FORMATTED_NUMERIC',
+    lambda value, cur: '' if value is None else '{:.2f}'.format(decimal.Decimal(value)))
+psycopg2.extensions.register_type(_FORMATTED_NUMERIC)
+
 # Forms
 import forms
 forms.db.init_app(app)
@@ -39,23 +61,50 @@ forms.db.init_app(app)
 # Tables
 import tables
 tables.db.init_app(app)
+app.teardown_appcontext(tables.close_conn)
 
 # flask-debugtoolbar
 from flask_debugtoolbar import DebugToolbarExtension
 toolbar = DebugToolbarExtension(app)
 
+# flask-compress: gzip the table-heavy HTML pages, which are repetitive
+# enough to shrink several-fold on the wire
+from flask_compress import Compress
+Compress(app)
+
 # flask-security
 from flask_security import Security, SQLAlchemyUserDatastore
 from flask_security import UserMixin, RoleMixin
 from flask_security import login_required
 
 # Misc
-from passlib.hash import bcrypt_sha256
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from passlib.context import CryptContext
 import click
 
 # Project local stuff
 import datagenerator
 
+# Password hashing context. Building this once forces passlib to settle on the
+# C-accelerated bcrypt backend (the pyca/bcrypt wheel in requirements.txt)
+# instead of re-detecting per hash, and exposes the work factor via config
+pwd_ctx = CryptContext(
+    schemes=['bcrypt_sha256'],
+    bcrypt_sha256__rounds=app.config.get('BCRYPT_ROUNDS', 12),
+    bcrypt_sha256__ident='2b')
+
+# Low-cost context for hashing throwaway accounts generated by initdb (each
+# extra round doubles the bcrypt work)
+seed_ctx = pwd_ctx.copy(
+    bcrypt_sha256__rounds=app.config.get('BCRYPT_SEED_ROUNDS', 4))
+
+def _hash_one(password):
+    '''Hash a single seed password. Lives at module scope so it can be
+    pickled over to ProcessPoolExecutor workers.
+    '''
+    return seed_ctx.hash(password)
+
 
 
 ####################
@@ -79,7 +128,9 @@ class UserRole(db.Model, RoleMixin):
 class User(db.Model, UserMixin):
     __tablename__ = 'flask_security_user'
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(40), unique=True)
+    # unique=True alone doesn't promise a lookup index in every dialect, so
+    # ask for the btree explicitly: /profile hits this column on every view
+    username = db.Column(db.String(40), unique=True, index=True)
     password = db.Column(db.String(255))
     email = db.Column(db.String(255))
     active = db.Column(db.Boolean())
@@ -88,12 +139,10 @@ class User(db.Model, UserMixin):
             backref=db.backref('users', lazy='dynamic'))
 
     def hash_password(self, password):
-        self.password = bcrypt_sha256.hash(password)
+        self.password = pwd_ctx.hash(password)
 
     def verify_password(self, password):
-        return bcrypt_sha256.verify(password, self.password)
-
-db.create_all()
+        return pwd_ctx.verify(password, self.password)
 
 
 user_datastore = SQLAlchemyUserDatastore(db, User, UserRole)
@@ -101,6 +150,7 @@ security = Security(app, user_datastore,
                     login_form=forms.ExtendedLoginForm,
                     register_form=forms.ExtendedRegisterForm)
 forms.security = security
+forms.pwd_ctx = pwd_ctx
 
 admin_role = user_datastore.create_role(
     name='admin',
@@ -126,15 +176,57 @@ def security_register_processor():
 # CLICK CLI COMMANDS #
 ######################
 
+# Pool of psycopg2 connections, so each get_db() call checks one out instead
+# of paying a full TCP+auth handshake
+pool = psycopg2.pool.ThreadedConnectionPool(
+    minconn=2, maxconn=20, **app.config['PSYCOPG2_LOGIN_INFO'])
+
+@contextmanager
 def get_db():
-    '''Sets up a psycopg2 database connection as configured in config.py'''
-    return psycopg2.connect(**app.config['PSYCOPG2_LOGIN_INFO'])
+    '''Checks out a psycopg2 database connection from the pool, returning it
+    when the block exits. Commits on success, rolls back on error, same as
+    psycopg2's own connection context manager.
+    '''
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+def bulk_assign_role(role_id, user_ids):
+    '''Grant one role to many users with a single batched INSERT, instead of
+    one round-trip per user through user_datastore.add_role_to_user
+    '''
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur,
+                'INSERT INTO flask_security_roles_users (user_id, role_id) VALUES %s',
+                [(user_id, role_id) for user_id in user_ids])
+
+@app.cli.command('create-all')
+def create_all():
+    '''Create any missing flask-security tables
+
+    This used to happen implicitly on every import, which cost a metadata
+    query per table per worker boot. Run this once against a fresh database
+    instead; initdb still rebuilds the tables itself.
+    '''
+    db.create_all()
+    print('Tables created')
 
 @app.cli.command('initdb')
 @click.argument('number', default=20)
 def initdb(number):
     '''Initialize the database with the randomly generated data'''
     with get_db() as conn:  # Open db connection to execute
+        # Load the schema, procedures, and generated data in one explicit
+        # transaction; get_db() commits once on the way out, so the WAL is
+        # fsynced once instead of per statement block
+        conn.autocommit = False
         with conn.cursor() as cur:
             with open('schema.sql','r') as f:
                 cur.execute(f.read())
@@ -150,33 +242,39 @@ def initdb(number):
     users_table_dict = datagenerator.make_users(number, verbosity=1)
     user_fields = users_table_dict['fields']
     users = users_table_dict['values']
-    for user in users:
-        userdict = {k:v for k,v in zip(user_fields, user)}
-        user_datastore.create_user(
-            username=userdict['username'],
-            email=userdict['email'],
-            password=userdict['password'],
-            active=True)
+
+    # Skip the ORM for the seed path: pre-hash every password, then stream
+    # all of the rows to the server in one batched statement rather than one
+    # INSERT round-trip per user
+    # bcrypt is pure CPU with no shared state between users, so spread the
+    # hashing across every core instead of grinding through it serially
+    userdicts = [{k:v for k,v in zip(user_fields, user)} for user in users]
+    plain = [userdict['password'] for userdict in userdicts]
+    with ProcessPoolExecutor() as executor:
+        hashes = list(executor.map(_hash_one, plain, chunksize=32))
+    for userdict, hashed in zip(userdicts, hashes):
+        userdict['password'] = hashed
+
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_batch(cur,
+                'INSERT INTO flask_security_user (username, email, password, active) '
+                'VALUES (%(username)s, %(email)s, %(password)s, true)',
+                userdicts, page_size=500)
 
     # Make a few users that we know will always exist
-    user_datastore.add_role_to_user(
-        user_datastore.create_user(
-            username='nullp0inter',
-            email='iguibas@mail.usf.edu',
-            password='_Hunter2',
-            active=True
-        ),
-        admin_role
+    nullp0inter = user_datastore.create_user(
+        username='nullp0inter',
+        email='iguibas@mail.usf.edu',
+        password='_Hunter2',
+        active=True
     )
 
-    user_datastore.add_role_to_user(
-        user_datastore.create_user(
-            username='admin',
-            email='admin@example.com',
-            password='password',
-            active=True
-        ),
-        admin_role
+    admin = user_datastore.create_user(
+        username='admin',
+        email='admin@example.com',
+        password='password',
+        active=True
     )
 
     user_datastore.create_user(
@@ -187,6 +285,9 @@ def initdb(number):
     )
 
     db.session.commit()
+
+    # Everyone getting the admin role gets it in one batched insert
+    bulk_assign_role(admin_role.id, [nullp0inter.id, admin.id])
     print('Database initialized')
 
 
@@ -208,9 +309,19 @@ def dbusertest():
 def favicon():
     return app.send_static_file('img/favicon.ico')
 
+def get_user_cached(username):
+    '''Look a user up by username, memoized on flask.g for the request.
+    Shares the '_user_cache' map the login form uses, so a login and a
+    profile render in one request cost a single SELECT between them.
+    '''
+    user_cache = g.setdefault('_user_cache', {})
+    if username not in user_cache:
+        user_cache[username] = User.query.filter_by(username=username).first()
+    return user_cache[username]
+
 @app.route('/profile/<username>')
 def profile(username):
-    user = User.query.filter_by(username=username).first()
+    user = get_user_cached(username)
     return render_template('profile.html', user=user)
 
 
@@ -223,16 +334,14 @@ def index():
 @login_required
 def users_page():
 
-    # Get the table for users:
-    usersTable = tables.UsersTable(tables.UsersTable.getUsers())
+    # Get the rows for the users table:
+    usersRows = tables.UsersTable.getUsers()
 
-    # Set up db to get numerical values
-    conn = db.engine.connect()
-    numUsers = conn.execute('SELECT COUNT(id) FROM flask_security_user;').fetchall()[0][0]
-    numAdmins = conn.execute('SELECT * FROM getNumFlaskAdmins();').fetchall()[0][0]
-    conn.close()
+    # Both counts come back in one round-trip
+    numUsers, numAdmins = tables.UsersTable.getPageStats()
 
-    return render_template('users.html', usersTable=usersTable,
+    return render_template('users.html',
+        usersCols=tables.UsersTable.columns, usersRows=usersRows,
         userCount=numUsers, admCount=numAdmins)
 
 @app.route('/createStore', methods=['GET', 'POST'])
@@ -264,12 +373,11 @@ def deleteStore():
 @login_required
 def stores_page():
 
-    # Generate the stores table
-    storesTable = tables.StoresTable(tables.StoresTable.getStores())
+    # Generate the stores table, fetching all three aggregates in one
+    # round-trip
+    storesRows = tables.StoresTable.getStores()
     form = forms.StoreFilterForm(request.form)
-    avg_sal= tables.StoresTable.getAvgSalAll()
-    avg_hrly = tables.StoresTable.getAvgHrlyAll()
-    numEmps = tables.StoresTable.getNumEmps()
+    avg_sal, avg_hrly, numEmps = tables.StoresTable.getPageStats()
 
     filType='None'
     filVal='ALL'
@@ -284,40 +392,32 @@ def stores_page():
             filType='Store ID'
             filVal=fval
 
-            storesTable = tables.StoresTable(tables.StoresTable.getStoresID(fval))  # Generate table with sid matching fval
-            avg_sal  = tables.StoresTable.getAvgSalStore(fval)
-            avg_hrly = tables.StoresTable.getAvgHrlyStore(fval)
-            numEmps  = tables.StoresTable.getNumEmpsStore(fval)
+            storesRows = tables.StoresTable.getStoresID(fval)  # Get rows with sid matching fval
+            avg_sal, avg_hrly, numEmps = tables.StoresTable.getPageStatsStore(fval)
 
         elif ftype == '2':  # By zip
 
             filType='Zip'
             filVal=fval
 
-            storesTable = tables.StoresTable(tables.StoresTable.getStoresZip(fval))
-            avg_sal  = tables.StoresTable.getAvgSalZip(fval)
-            avg_hrly = tables.StoresTable.getAvgHrlyZip(fval)
-            numEmps  = tables.StoresTable.getNumEmpsZip(fval)
+            storesRows = tables.StoresTable.getStoresZip(fval)
+            avg_sal, avg_hrly, numEmps = tables.StoresTable.getPageStatsZip(fval)
 
         elif ftype == '3':  # By city
             
             filType='City'
             filVal=fval
 
-            storesTable = tables.StoresTable(tables.StoresTable.getStoresCity(fval))
-            avg_sal  = tables.StoresTable.getAvgSalCity(fval)
-            avg_hrly = tables.StoresTable.getAvgHrlyCity(fval)
-            numEmps  = tables.StoresTable.getNumEmpsCity(fval)
+            storesRows = tables.StoresTable.getStoresCity(fval)
+            avg_sal, avg_hrly, numEmps = tables.StoresTable.getPageStatsCity(fval)
 
         elif ftype == '4':  # By state
             
             filType='State'
             filVal=fval
 
-            storesTable = tables.StoresTable(tables.StoresTable.getStoresState(fval))
-            avg_sal  = tables.StoresTable.getAvgSalState(fval)
-            avg_hrly = tables.StoresTable.getAvgHrlyState(fval)
-            numEmps  = tables.StoresTable.getNumEmpsState(fval)
+            storesRows = tables.StoresTable.getStoresState(fval)
+            avg_sal, avg_hrly, numEmps = tables.StoresTable.getPageStatsState(fval)
 
 
     return render_template(
@@ -325,17 +425,28 @@ def stores_page():
         form=form,
         filType=filType,
         filVal=filVal,
-        storesTable=storesTable,
+        storesCols=tables.StoresTable.columns,
+        storesRows=storesRows,
         avg_sal=avg_sal,
         avg_hrly=avg_hrly,
         numEmps=numEmps
     )
 
+# An unbound EmpCreateForm renders identically for every GET, so build it
+# once instead of re-instantiating the form (and its fields) per request
+_empty_emp_create_form = forms.EmpCreateForm()
+
 @app.route('/createEmployee', methods=['GET','POST'])
 @login_required
 def createEmployee():
+    if request.method == 'GET':
+        return render_template(
+            'createEmployee.html',
+            cform=_empty_emp_create_form
+        )
+
     cform = forms.EmpCreateForm(request.form, csrf_enabled=True)
-    if request.method == 'POST' and cform.validate():
+    if cform.validate():
         return redirect('/employees')
 
     # otherwise reprint the form
@@ -370,11 +481,10 @@ def employees_page():
     filVal = 'ALL'
 
     # ADD LOGIC BASED ON FORM HERE
-    avg_sal= tables.EmpTable.getAvgSalAll()
-    avg_hrly = tables.EmpTable.getAvgHrlyAll()
-    
+    avg_sal, avg_hrly = tables.EmpTable.getPageStats()
+
     # Define the table itself
-    empTable = tables.EmpTable(tables.EmpTable.getEmployees())
+    empRows = tables.EmpTable.getEmployees()
 
     form = forms.EmployeeFilterForm(request.form)
 
@@ -389,36 +499,32 @@ def employees_page():
             filType = 'Store ID'
             filVal = fval
 
-            empTable = tables.EmpTable(tables.EmpTable.getEmployeesStore(fval))
-            avg_sal = tables.EmpTable.getAvgSalStore(fval)
-            avg_hrly = tables.EmpTable.getAvgHrlyStore(fval)
+            empRows = tables.EmpTable.getEmployeesStore(fval)
+            avg_sal, avg_hrly = tables.EmpTable.getPageStatsStore(fval)
 
         elif ftype == '2':  # Zip
 
             filType = 'Zip'
             filVal = fval
 
-            empTable = tables.EmpTable(tables.EmpTable.getEmployeesZip(fval))
-            avg_sal = tables.EmpTable.getAvgSalZip(fval)
-            avg_hrly = tables.EmpTable.getAvgHrlyZip(fval)
+            empRows = tables.EmpTable.getEmployeesZip(fval)
+            avg_sal, avg_hrly = tables.EmpTable.getPageStatsZip(fval)
 
         elif ftype == '3':  # City
 
             filType = 'City'
             filVal = fval
 
-            empTable = tables.EmpTable(tables.EmpTable.getEmployeesCity(fval))
-            avg_sal = tables.EmpTable.getAvgSalCity(fval)
-            avg_hrly = tables.EmpTable.getAvgHrlyCity(fval)
+            empRows = tables.EmpTable.getEmployeesCity(fval)
+            avg_sal, avg_hrly = tables.EmpTable.getPageStatsCity(fval)
 
         elif ftype == '4': # State
 
             filType = 'State'
             filVal = fval
 
-            empTable = tables.EmpTable(tables.EmpTable.getEmployeesState(fval))
-            avg_sal = tables.EmpTable.getAvgSalState(fval)
-            avg_hrly = tables.EmpTable.getAvgHrlyState(fval)
+            empRows = tables.EmpTable.getEmployeesState(fval)
+            avg_sal, avg_hrly = tables.EmpTable.getPageStatsState(fval)
 
     
     return render_template(
@@ -428,7 +534,8 @@ def employees_page():
         filType=filType,
         avg_sal_str=avg_sal_str,
         avg_hourly_str=avg_hourly_str,
-        empTable=empTable,
+        empCols=tables.EmpTable.columns,
+        empRows=empRows,
         avg_sal=avg_sal,
         avg_hrly=avg_hrly
     )
@@ -473,11 +580,10 @@ def addExistingProduct():
 @login_required
 def products_page():
 
-    # Generate the table with ALL products
-    productsTable = tables.ProductsTable(tables.ProductsTable.getProducts())
-    avgPrice = tables.ProductsTable.getAvgPrice()
-    numProducts = tables.ProductsTable.getNumProducts()
-    numSale = tables.ProductsTable.getNumSale()
+    # Generate the table with ALL products, fetching all three aggregates in
+    # one round-trip
+    productsRows = tables.ProductsTable.getProducts()
+    avgPrice, numProducts, numSale = tables.ProductsTable.getPageStats()
 
     filType = 'None'
     filVal = 'ALL'
@@ -494,57 +600,48 @@ def products_page():
             filType = 'Store'
             filVal = fval
 
-            productsTable = tables.ProductsTable(tables.ProductsTable.getProductsStore(fval))
-            avgPrice = tables.ProductsTable.getAvgPriceStore(fval)
-            numProducts = tables.ProductsTable.getNumProductsStore(fval)
-            numSale = tables.ProductsTable.getNumSaleStore(fval)
+            productsRows = tables.ProductsTable.getProductsStore(fval)
+            avgPrice, numProducts, numSale = tables.ProductsTable.getPageStatsStore(fval)
 
         elif ftype == '2':  # Zip
 
             filType = 'Zip'
             filVal = fval
 
-            productsTable = tables.ProductsTable(tables.ProductsTable.getProductsZip(fval))
-            avgPrice = tables.ProductsTable.getAvgPriceZip(fval)
-            numProducts = tables.ProductsTable.getNumProductsZip(fval)
-            numSale = tables.ProductsTable.getNumSaleZip(fval)
+            productsRows = tables.ProductsTable.getProductsZip(fval)
+            avgPrice, numProducts, numSale = tables.ProductsTable.getPageStatsZip(fval)
 
         elif ftype == '3':  # City
 
             filType = 'City'
             filVal = fval
 
-            productsTable = tables.ProductsTable(tables.ProductsTable.getProductsCity(fval))
-            avgPrice = tables.ProductsTable.getAvgPriceCity(fval)
-            numProducts = tables.ProductsTable.getNumProductsCity(fval)
-            numSale = tables.ProductsTable.getNumSaleCity(fval)
+            productsRows = tables.ProductsTable.getProductsCity(fval)
+            avgPrice, numProducts, numSale = tables.ProductsTable.getPageStatsCity(fval)
 
         elif ftype == '4':  # State
 
             filType = 'State'
             filVal = fval
 
-            productsTable = tables.ProductsTable(tables.ProductsTable.getProductsState(fval))
-            avgPrice = tables.ProductsTable.getAvgPriceState(fval)
-            numProducts = tables.ProductsTable.getNumProductsState(fval)
-            numSale = tables.ProductsTable.getNumSaleState(fval)
+            productsRows = tables.ProductsTable.getProductsState(fval)
+            avgPrice, numProducts, numSale = tables.ProductsTable.getPageStatsState(fval)
 
         elif ftype == '5':  # Color
 
             filType = 'Color'
             filVal = fval
 
-            productsTable = tables.ProductsTable(tables.ProductsTable.getProductsColor(fval))
-            avgPrice = tables.ProductsTable.getAvgPriceColor(fval)
-            numProducts = tables.ProductsTable.getNumProductsColor(fval)
-            numSale = tables.ProductsTable.getNumSaleColor(fval)
+            productsRows = tables.ProductsTable.getProductsColor(fval)
+            avgPrice, numProducts, numSale = tables.ProductsTable.getPageStatsColor(fval)
 
     return render_template(
         'products.html',
         form=form,
         filType=filType,
         filVal=filVal,
-        productsTable=productsTable,
+        productsCols=tables.ProductsTable.columns,
+        productsRows=productsRows,
         avgPrice=avgPrice,
         numProducts=numProducts,
         numSale=numSale
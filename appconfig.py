@@ -39,6 +39,19 @@ class Config():
     SECURITY_PASSWORD_HASH = 'bcrypt'
     SECURITY_PASSWORD_SALT = 'SuperSecretSalt'
 
+    # bcrypt work factor for password hashing. BCRYPT_SEED_ROUNDS is used only
+    # when `initdb` hashes throwaway generated accounts
+    BCRYPT_ROUNDS = 12
+    BCRYPT_SEED_ROUNDS = 4
+
+    # The bundled static assets only change between deploys, so let browsers
+    # cache them for 30 days instead of Flask's 12 hour default (Flask
+    # already sends ETags, so a stale asset costs one conditional request)
+    SEND_FILE_MAX_AGE_DEFAULT = 2592000
+
+    # gzip level for flask-compress; 4 trades a little ratio for encode speed
+    COMPRESS_LEVEL = 4
+
 
 class DebugConfig(Config):
 
@@ -13,6 +13,7 @@ purposes.
 '''
 import decimal
 import random
+import io
 import os, os.path
 import sys
 import csv
@@ -396,13 +397,17 @@ def make_users(n, verbosity=False):
     passwords = pass_gen()
 
     values = []
+    seen = set()
     for uid in range(1, n+1):
         uname = next(unames)
         email = uname + '@example.com'
         password = next(passwords)
 
-        if uname in (user[0] for user in values):
+        # Set membership keeps the duplicate check O(1) instead of rescanning
+        # every previously generated user
+        if uname in seen:
             continue
+        seen.add(uname)
 
         values.append((uname, email, password))
 
@@ -461,15 +466,22 @@ def write_tables_db(n, conn, verbosity=0):
     with conn.cursor() as cur:
         for tablename, tabledict in tables.items():
             fieldspec = '(' + ','.join(tabledict['fields']) + ')'
-            query = 'insert into {} {} values %s'.format(tablename, fieldspec)
+            query = 'COPY {} {} FROM STDIN WITH CSV'.format(tablename, fieldspec)
             if verbosity:
                 print(query)
 
+            # COPY streams the whole table in one protocol exchange, which
+            # beats per-row (or even batched) INSERTs by a wide margin
+            buf = io.StringIO()
+            writer = csv.writer(buf)
             for row in tabledict['values']:
                 if verbosity > 1:
                     print(row)
 
-                cur.execute(query, (row,))
+                writer.writerow(row)
+
+            buf.seek(0)
+            cur.copy_expert(query, buf)
 
             if 'pkey' in tabledict:
                 query = "select setval('{}_{}_seq', %s)".format(tablename, tabledict['pkey'])
@@ -1,3 +1,5 @@
+from flask import g
+
 from wtforms import Form
 from wtforms import FloatField, IntegerField, SelectField, SubmitField
 from wtforms import BooleanField, StringField
@@ -10,6 +12,12 @@ from flask_security.confirmable import requires_confirmation
 from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
+# Role choices for EmpCreateForm, hoisted to an immutable module-level
+# constant so form construction reuses one tuple instead of building a fresh
+# list of pairs every time
+ROLE_CHOICES = ((1,'Cashier'), (2,'Manager'), (3,'Stocker'),
+                (4,'Human Resources'), (5,'Information Technology'))
+
 # Employee Deletion
 class EmpDeleteForm(Form):
     '''Creates the form to delete an employee.
@@ -46,8 +54,7 @@ class EmpCreateForm(Form):
     lastname  = StringField('Last Name', validators=[Required()])
     hourly    = BooleanField('Paid Hourly', validators=[Required()])
     pay       = FloatField('Pay', validators=[Required()])
-    roleid    = SelectField('Role ID', choices=[(1,'Cashier'),(2,'Manager'),
-        (3,'Stocker'),(4,'Human Resources'),(5,'Information Technology')],
+    roleid    = SelectField('Role ID', choices=ROLE_CHOICES,
          validators=[Required()], coerce=int)
     sid       = IntegerField('Store ID', validators=[Required()])
     submit    = SubmitField('Create')
@@ -365,9 +372,15 @@ class ExtendedLoginForm(LoginForm):
             self.password.errors.append('PASSWORD NOT PROVIDED')
             return False
 
-        # set the user to be the user name in the field and look it up
-        # in the database
-        self.user = security.datastore.get_user(self.username.data)
+        # set the user to be the user name in the field and look it up in
+        # the database, memoizing the row on flask.g so anything else during
+        # this request that wants the same user skips a second SELECT.
+        # g dies with the request, so there is no staleness to manage
+        user_cache = g.setdefault('_user_cache', {})
+        if self.username.data not in user_cache:
+            user_cache[self.username.data] = security.datastore.get_user(
+                self.username.data)
+        self.user = user_cache[self.username.data]
 
         # Ensure the user exists in the database
         if self.user is None:
@@ -379,10 +392,9 @@ class ExtendedLoginForm(LoginForm):
             self.password.errors.append('PASSWORD WAS NOT SET')
             return False
 
-        # Verify the password provided matches what is in the database for that user
-        if not verify_and_update_password(self.password.data, self.user):
-            self.password.errors.append('INCORRECT USERNAME/PASSWORD')
-            return False
+        # Check the cheap account-state conditions before touching bcrypt:
+        # a disabled or unconfirmed account fails fast without paying for a
+        # full password verification
 
         # If user confirmation is enabled and the user has not confirmed, deny access
         if requires_confirmation(self.user):
@@ -394,6 +406,26 @@ class ExtendedLoginForm(LoginForm):
             self.username.errors.append('DISABLED ACCOUNT')
             return False
 
+        # Verify the password provided matches what is in the database for
+        # that user. Hashes pwd_ctx recognizes (bcrypt_sha256) get a plain
+        # constant-time verify here, and any policy rehash (e.g. accounts
+        # seeded at BCRYPT_SEED_ROUNDS) is written back through the
+        # datastore; in the steady state there is no write at all. Hashes
+        # pwd_ctx can't identify, like the plain bcrypt ones flask-security's
+        # register view stores, still go through verify_and_update_password
+        if pwd_ctx.identify(self.user.password, required=False):
+            if not pwd_ctx.verify(self.password.data, self.user.password):
+                self.password.errors.append('INCORRECT USERNAME/PASSWORD')
+                return False
+
+            if pwd_ctx.needs_update(self.user.password):
+                self.user.password = pwd_ctx.hash(self.password.data)
+                security.datastore.put(self.user)
+                security.datastore.commit()
+        elif not verify_and_update_password(self.password.data, self.user):
+            self.password.errors.append('INCORRECT USERNAME/PASSWORD')
+            return False
+
         # If all other checks are passed, the user is valid
         return True
 
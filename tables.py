@@ -1,454 +1,492 @@
-from flask_table import Table, Col
+import functools
+import time
+
+import psycopg2.extras
+
+from flask import g, has_app_context
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 db = SQLAlchemy()
 
-class UsersTable(Table):
 
-    # Set the classes for the table
-    classes = ['table', 'table-inverse', 'inlineTable', 'table-condensed']
+def _conn():
+    '''Get the execution target for the current request.
+
+    The first accessor call in a request checks one connection out of the
+    pool and stashes it on flask.g; every later call in the same request
+    reuses it, so a page that needs several queries pays for one checkout
+    and keeps its server-side state (plans, GUCs) warm. app.py registers
+    close_conn() to return it when the request tears down. Outside an
+    application context (e.g. the CLI) this falls back to the engine's
+    connectionless execution.
+    '''
+    if not has_app_context():
+        return db.engine
+    if '_tables_conn' not in g:
+        g._tables_conn = db.engine.connect()
+    return g._tables_conn
+
+def close_conn(exc=None):
+    '''Return the request-scoped connection to the pool, if one was opened.
+    Registered as a teardown_appcontext handler in app.py.
+    '''
+    conn = g.pop('_tables_conn', None)
+    if conn is not None:
+        conn.close()
+
+# Cache for the scalar page statistics, keyed by accessor + arguments. The
+# aggregates scan whole tables but change rarely relative to page traffic,
+# so serving them slightly stale is a fine trade for skipping the round-trip
+_stat_cache = {}
+_STAT_CACHE_TTL = 30     # seconds
+_STAT_CACHE_MAX = 1024   # distinct filter values before the cache resets
+
+def _cached(f):
+    '''Memoize a statistics accessor for a short window (_STAT_CACHE_TTL)'''
+    @functools.wraps(f)
+    def wrapper(*args):
+        key = (f.__qualname__,) + args
+        hit = _stat_cache.get(key)
+        now = time.monotonic()
+        if hit is not None and now - hit[1] < _STAT_CACHE_TTL:
+            return hit[0]
+
+        if len(_stat_cache) >= _STAT_CACHE_MAX:
+            _stat_cache.clear()
+
+        value = f(*args)
+        _stat_cache[key] = (value, now)
+        return value
+    return wrapper
+
+
+def _query(sql, **params):
+    '''Run a parameterized query against the shared engine, returning the
+    result set. Binding the arguments (instead of formatting them into the
+    SQL string) keeps the statements injection-safe and lets the server
+    reuse one cached plan per statement instead of reparsing every call.
+    '''
+    return _conn().execute(text(sql), **params)
+
+def _scalar(sql, **params):
+    '''Run a parameterized query that produces a single value'''
+    return _conn().execute(text(sql), **params).scalar()
+
+def _row(sql, **params):
+    '''Run a parameterized query that produces a single row'''
+    return _conn().execute(text(sql), **params).first()
 
-    id=Col('id')
-    username=Col('username')
-    password=Col('password')
-    email=Col('email')
-    active=Col('active')
+def _stream(name, sql, itersize=1000):
+    '''Stream a large result set through a server-side (named) cursor.
+
+    Rows arrive from the server in itersize batches while the caller (table
+    rendering) consumes them, so peak memory stays bounded by the batch size
+    instead of the full result set. The cursor and its connection go back to
+    the pool once the generator is exhausted or closed.
+    '''
+    conn = db.engine.raw_connection()
+    try:
+        cur = conn.cursor(name=name, cursor_factory=psycopg2.extras.DictCursor)
+        cur.itersize = itersize
+        cur.execute(sql)
+        try:
+            # Pull rows a batch at a time and hand each batch straight
+            # through; this skips the per-row StopIteration bookkeeping that
+            # iterating the cursor itself would do
+            while True:
+                batch = cur.fetchmany(itersize)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+
+
+class UsersTable:
+    '''Queries backing the flask users page'''
+
+    columns = ('id', 'username', 'password', 'email', 'active')
 
     def getUsers():
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM flask_security_user;')
-        conn.close()
-        return result
+        return _stream('users_stream', 'SELECT * FROM flask_security_user;')
+
+    @_cached
+    def getPageStats():
+        '''Get (user count, admin count) in a single round-trip'''
+        return _row('SELECT (SELECT COUNT(id) FROM flask_security_user), '
+                    'getNumFlaskAdmins();')
 
-class StoresTable(Table):
+class StoresTable:
     '''Declare the Stores Table
-    This declares the table for stores and their information.
-    It is important to rememebr that each variable declared
-    here counts as a "column" in the table and will be used
-    in the object class of the same type below. It is important
-    that whatever the names of attributes are match up between
-    the table and the "item" which is the "row"
+    This holds the queries for stores and their information.
+    It is important to rememebr that each name in columns will
+    be looked up in every row the queries return, so the two
+    have to match up.
     '''
-    # Set the classes for the table
-    classes = ['table', 'table-inverse', 'inlineTable', 'table-condensed']
 
-    sid = Col('sid')
-    address = Col('address')
-    city = Col('city')
-    state = Col('state')
-    zip = Col('zip')
-    telno = Col('telno')
+    columns = ('sid', 'address', 'city', 'state', 'zip', 'telno')
 
     # Get stores tables based on criteria
     def getStores():
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM stores;')
-        conn.close()
-        return result
+        return _query('SELECT * FROM stores;')
+
+    @_cached
+    def getPageStats():
+        '''Get (avg salary, avg hourly pay, employee count) in a single
+        round-trip rather than three serial SELECTs
+        '''
+        return _row('SELECT getAvgSalAll(), getAvgHrlyAll(), getNumEmps();')
+
+    @_cached
+    def getPageStatsStore(sid):
+        '''Get (avg salary, avg hourly pay, employee count) for one store'''
+        return _row('SELECT avg_salary_store(:sid), avg_hourly_store(:sid), '
+                    'getNumEmpsStore(:sid);', sid=sid)
+
+    @_cached
+    def getPageStatsZip(zip):
+        '''Get (avg salary, avg hourly pay, employee count) for a zip'''
+        return _row('SELECT avg_salary_zip(:zip), avg_hourly_zip(:zip), '
+                    'getNumEmpsZip(:zip);', zip=zip)
+
+    @_cached
+    def getPageStatsCity(city):
+        '''Get (avg salary, avg hourly pay, employee count) for a city'''
+        return _row('SELECT avg_salary_city(:city), avg_hourly_city(:city), '
+                    'getNumEmpsCity(:city);', city=city)
+
+    @_cached
+    def getPageStatsState(state):
+        '''Get (avg salary, avg hourly pay, employee count) for a state'''
+        return _row('SELECT avg_salary_state(:state), avg_hourly_state(:state), '
+                    'getNumEmpsState(:state);', state=state)
 
     def getStoresZip(zip):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getStoresZip(\'{0}\');'.format(zip))
-        conn.close()
-        return result;
+        return _query('SELECT * FROM getStoresZip(:zip);', zip=zip)
 
     def getStoresCity(city):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getStoresCity(\'{0}\');'.format(city))
-        conn.close()
-        return result;
+        return _query('SELECT * FROM getStoresCity(:city);', city=city)
 
     def getStoresState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getStoresState(\'{0}\');'.format(state))
-        conn.close()
-        return result;
+        return _query('SELECT * FROM getStoresState(:state);', state=state)
 
     def getStoresID(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getStoresID({0});'.format(sid))
-        conn.close()
-        return result;
+        return _query('SELECT * FROM getStoresID(:sid);', sid=sid)
 
 
     # Averages
+    @_cached
     def getAvgSalAll():
         '''Get the overall average salary'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgSalAll();').first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgSalAll();')
 
+    @_cached
     def getAvgHrlyAll():
         '''Get the overall average hourly pay'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgHrlyAll();').first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgHrlyAll();')
 
+    @_cached
     def getAvgSalStore(sid):
         '''Get average salary by store'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_store({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_store(:sid);', sid=sid)
 
+    @_cached
     def getAvgHrlyStore(sid):
         '''Gets the average salary by store'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_store({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_hourly_store(:sid);', sid=sid)
 
 
+    @_cached
     def getAvgSalZip(zip):
         '''Get the average salary based on zip'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_zip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_zip(:zip);', zip=zip)
 
+    @_cached
     def getAvgHrlyZip(zip):
         '''Get the average hourly pay based on zip'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_zip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_hourly_zip(:zip);', zip=zip)
 
+    @_cached
     def getAvgSalCity(city):
         '''Get the average salary based on city'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_city(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_city(:city);', city=city)
 
+    @_cached
     def getAvgHrlyCity(city):
         '''Get the average hourly pay based on city'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_city(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_hourly_city(:city);', city=city)
 
+    @_cached
     def getAvgSalState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_state(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_state(:state);', state=state)
 
+    @_cached
     def getAvgHrlyState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_state(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_hourly_state(:state);', state=state)
 
 
     # Number of employees
     #----------------------
+    @_cached
     def getNumEmps():
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumEmps();').first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumEmps();')
 
+    @_cached
     def getNumEmpsStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumEmpsStore({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumEmpsStore(:sid);', sid=sid)
 
+    @_cached
     def getNumEmpsZip(zip):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumEmpsZip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumEmpsZip(:zip);', zip=zip)
 
+    @_cached
     def getNumEmpsCity(city):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumEmpsCity(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumEmpsCity(:city);', city=city)
 
+    @_cached
     def getNumEmpsState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumEmpsState(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
-
+        return _scalar('SELECT * FROM getNumEmpsState(:state);', state=state)
 
 
 
-class EmpTable(Table):
-    '''Table container and generation class for Employees'''
 
-    # Set the classes for the table
-    classes = ['table', 'table-inverse', 'inlineTable', 'table-condensed']
+class EmpTable:
+    '''Table queries and column layout for Employees'''
 
-    eid=Col('eid')
-    firstname=Col('firstname')
-    lastname=Col('lastname')
-    hourly=Col('hourly')
-    pay = Col('pay')
-    roleid=Col('roleid')
-    sid=Col('sid')
+    columns = ('eid', 'firstname', 'lastname', 'hourly', 'pay', 'roleid', 'sid')
 
     # Whole tables
     def getEmployees():
         '''Get the list of all employees'''
-        conn = db.engine.connect()
-        getEmps  = 'SELECT * FROM employees NATURAL JOIN employment order by eid;'
-        result = conn.execute(getEmps)
-        conn.close()
-        return result
+        return _stream('emp_stream',
+                       'SELECT * FROM employees NATURAL JOIN employment order by eid;')
+
+    @_cached
+    def getPageStats():
+        '''Get (avg salary, avg hourly pay) in a single round-trip'''
+        return _row('SELECT getAvgSalAll(), getAvgHrlyAll();')
+
+    @_cached
+    def getPageStatsStore(sid):
+        '''Get (avg salary, avg hourly pay) for one store'''
+        return _row('SELECT avg_salary_store(:sid), avg_hourly_store(:sid);',
+                    sid=sid)
+
+    @_cached
+    def getPageStatsZip(zip):
+        '''Get (avg salary, avg hourly pay) for a zip'''
+        return _row('SELECT avg_salary_zip(:zip), avg_hourly_zip(:zip);',
+                    zip=zip)
+
+    @_cached
+    def getPageStatsCity(city):
+        '''Get (avg salary, avg hourly pay) for a city'''
+        return _row('SELECT avg_salary_city(:city), avg_hourly_city(:city);',
+                    city=city)
+
+    @_cached
+    def getPageStatsState(state):
+        '''Get (avg salary, avg hourly pay) for a state'''
+        return _row('SELECT avg_salary_state(:state), avg_hourly_state(:state);',
+                    state=state)
 
     def getEmployeesZip(zip):
         '''Get employee table filtered by zip'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getEmpZip(\'{0}\');'.format(zip))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getEmpZip(:zip);', zip=zip)
 
     def getEmployeesCity(city):
         '''Get employee table filtered by city'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getEmpCity(\'{0}\');'.format(city))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getEmpCity(:city);', city=city)
 
     def getEmployeesState(state):
         '''Get employee table based on state'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getEmpState(\'{0}\');'.format(state))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getEmpState(:state);', state=state)
 
     def getEmployeesStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getEmpStore({0});'.format(sid))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getEmpStore(:sid);', sid=sid)
 
     # Averages
+    @_cached
     def getAvgSalAll():
         '''Get the overall average salary'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgSalAll();').first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgSalAll();')
 
+    @_cached
     def getAvgHrlyAll():
         '''Get the overall average hourly pay'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgHrlyAll();').first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgHrlyAll();')
 
+    @_cached
     def getAvgSalZip(zip):
         '''Get the average salary based on zip'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_zip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_zip(:zip);', zip=zip)
 
+    @_cached
     def getAvgHrlyZip(zip):
         '''Get the average hourly pay based on zip'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_zip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_hourly_zip(:zip);', zip=zip)
 
+    @_cached
     def getAvgSalCity(city):
         '''Get the average salary based on city'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_city(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_city(:city);', city=city)
 
+    @_cached
     def getAvgHrlyCity(city):
         '''Get the average hourly pay based on city'''
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_city(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_hourly_city(:city);', city=city)
 
+    @_cached
     def getAvgSalState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_state(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_state(:state);', state=state)
 
+    @_cached
     def getAvgHrlyState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_state(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_hourly_state(:state);', state=state)
 
+    @_cached
     def getAvgSalStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_salary_store({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM avg_salary_store(:sid);', sid=sid)
 
+    @_cached
     def getAvgHrlyStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM avg_hourly_store({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
-
-class ProductsTable(Table):
+        return _scalar('SELECT * FROM avg_hourly_store(:sid);', sid=sid)
 
-    # Design stuff
-    classes = ['table', 'table-inverse', 'inlineTable', 'table-condensed']
+class ProductsTable:
+    '''Table queries and column layout for Products'''
 
-    pid=Col('pid')
-    name=Col('name')
-    color=Col('color')
-    sid=Col('sid')
+    columns = ('pid', 'name', 'color', 'sid')
 
     def getProducts():
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getProds();')
-        conn.close()
-        return result
+        return _query('SELECT * FROM getProds();')
+
+    @_cached
+    def getPageStats():
+        '''Get (avg price, product count, number on sale) in a single
+        round-trip rather than three serial SELECTs
+        '''
+        return _row('SELECT getAvgPrice(), getNumProds(), getNumSale();')
+
+    @_cached
+    def getPageStatsStore(sid):
+        '''Get (avg price, product count, number on sale) for one store'''
+        return _row('SELECT getAvgPriceStore(:sid), getNumProdsStore(:sid), '
+                    'getNumSaleStore(:sid);', sid=sid)
+
+    @_cached
+    def getPageStatsZip(zip):
+        '''Get (avg price, product count, number on sale) for a zip'''
+        return _row('SELECT getAvgPriceZip(:zip), getNumProdsZip(:zip), '
+                    'getNumSaleZip(:zip);', zip=zip)
+
+    @_cached
+    def getPageStatsCity(city):
+        '''Get (avg price, product count, number on sale) for a city'''
+        return _row('SELECT getAvgPriceCity(:city), getNumProdsCity(:city), '
+                    'getNumSaleCity(:city);', city=city)
+
+    @_cached
+    def getPageStatsState(state):
+        '''Get (avg price, product count, number on sale) for a state'''
+        return _row('SELECT getAvgPriceState(:state), getNumProdsState(:state), '
+                    'getNumSaleState(:state);', state=state)
+
+    @_cached
+    def getPageStatsColor(color):
+        '''Get (avg price, product count, number on sale) for a color'''
+        return _row('SELECT getAvgPriceColor(:color), getNumProdsColor(:color), '
+                    'getNumSaleColor(:color);', color=color)
 
     def getProductsStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getProdStore({0});'.format(sid))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getProdStore(:sid);', sid=sid)
 
     def getProductsZip(zip):
-        conn=db.engine.connect()
-        result = conn.execute('Select * FROM getProdZip(\'{0}\');'.format(zip))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getProdZip(:zip);', zip=zip)
 
     def getProductsCity(city):
-        conn=db.engine.connect()
-        result = conn.execute('Select * FROM getProdCity(\'{0}\');'.format(city))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getProdCity(:city);', city=city)
 
     def getProductsState(state):
-        conn=db.engine.connect()
-        result = conn.execute('Select * FROM getProdState(\'{0}\');'.format(state))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getProdState(:state);', state=state)
 
     def getProductsColor(color):
-        conn=db.engine.connect()
-        result = conn.execute('Select * FROM getProdColor(\'{0}\');'.format(color))
-        conn.close()
-        return result
+        return _query('SELECT * FROM getProdColor(:color);', color=color)
 
     # Averages
-    # These return single value so use .first()[0]
+    @_cached
     def getAvgPrice():
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgPrice();').first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgPrice();')
 
+    @_cached
     def getAvgPriceZip(zip):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgPriceZip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgPriceZip(:zip);', zip=zip)
 
+    @_cached
     def getAvgPriceCity(city):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgPriceCity(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgPriceCity(:city);', city=city)
 
+    @_cached
     def getAvgPriceState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgPriceState(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgPriceState(:state);', state=state)
 
+    @_cached
     def getAvgPriceStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgPriceStore({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgPriceStore(:sid);', sid=sid)
 
+    @_cached
     def getAvgPriceColor(color):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getAvgPriceColor(\'{0}\');'.format(color)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getAvgPriceColor(:color);', color=color)
 
 
     # Product count
+    @_cached
     def getNumProducts():
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumProds();').first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumProds();')
 
+    @_cached
     def getNumProductsStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumProdsStore({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumProdsStore(:sid);', sid=sid)
 
+    @_cached
     def getNumProductsZip(zip):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumProdsZip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumProdsZip(:zip);', zip=zip)
 
+    @_cached
     def getNumProductsCity(city):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumProdsCity(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumProdsCity(:city);', city=city)
 
+    @_cached
     def getNumProductsState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumProdsState(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumProdsState(:state);', state=state)
 
+    @_cached
     def getNumProductsColor(color):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumProdsColor(\'{0}\');'.format(color)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumProdsColor(:color);', color=color)
 
     # Num products on Sale
+    @_cached
     def getNumSale():
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumSale();').first()[0]
-        conn.close()
-        return result;
+        return _scalar('SELECT * FROM getNumSale();')
 
+    @_cached
     def getNumSaleStore(sid):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumSaleStore({0});'.format(sid)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumSaleStore(:sid);', sid=sid)
 
+    @_cached
     def getNumSaleZip(zip):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumSaleZip(\'{0}\');'.format(zip)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumSaleZip(:zip);', zip=zip)
 
+    @_cached
     def getNumSaleCity(city):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumSaleCity(\'{0}\');'.format(city)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumSaleCity(:city);', city=city)
 
+    @_cached
     def getNumSaleState(state):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumSaleState(\'{0}\');'.format(state)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumSaleState(:state);', state=state)
 
+    @_cached
     def getNumSaleColor(color):
-        conn = db.engine.connect()
-        result = conn.execute('SELECT * FROM getNumSaleColor(\'{0}\');'.format(color)).first()[0]
-        conn.close()
-        return result
+        return _scalar('SELECT * FROM getNumSaleColor(:color);', color=color)